@@ -1,11 +1,38 @@
 from abc import ABC, abstractmethod
+import asyncio
+from collections import OrderedDict
 import os
-from typing import Generator, Optional
+import warnings
+from typing import Any, AsyncGenerator, ClassVar, Dict, Generator, List, Optional, Tuple
+import httpx
+import orjson
+import xxhash
 from dotenv import load_dotenv
+from .sse import aiter_sse_data, iter_sse_data
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 load_dotenv()
 
+# Connection pool shared by the requests of a single provider instance
+_LIMITS = httpx.Limits(max_keepalive_connections=32)
+_TIMEOUT = httpx.Timeout(None, connect=10.0)
+
+# Seconds between status checks of a submitted provider batch
+BATCH_POLL_INTERVAL = 10.0
+
+def _run(coro):
+    """Run a coroutine to completion, on uvloop's faster event loop when installed."""
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
 class BaseLLM(ABC):
+    # Display name used in error messages
+    provider_name = "LLM"
     def __init__(
         self,
         model: Optional[str] = None,
@@ -14,6 +41,7 @@ class BaseLLM(ABC):
         top_p: float = 0.9,
         frequency_penalty: float = 0.0,
         presence_penalty: float = 0.0,
+        cache_size: int = 512,
         **kwargs
     ):
         if not 0 <= temperature <= 1:
@@ -28,11 +56,319 @@ class BaseLLM(ABC):
         self.frequency_penalty = frequency_penalty
         self.presence_penalty = presence_penalty
         self.options = kwargs
+        self.cache_size = cache_size
+        self._cache: OrderedDict[int, str] = OrderedDict()
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def client(self) -> httpx.Client:
+        """HTTP/2 client reused across calls, created on first use."""
+        if self._client is None:
+            self._client = httpx.Client(http2=True, limits=_LIMITS, timeout=_TIMEOUT)
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """
+        Async HTTP/2 client bound to the running event loop, created on first use.
+
+        A client can only be used on the loop it was created on. Await aclose()
+        before that loop ends (e.g. at the end of the coroutine given to
+        asyncio.run()); otherwise the next loop replaces the client and warns.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._drop_async_client()
+            self._async_client = httpx.AsyncClient(http2=True, limits=_LIMITS, timeout=_TIMEOUT)
+            self._async_client_loop = loop
+        return self._async_client
+
+    def close(self):
+        """Close the pooled HTTP connections."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        """Close the pooled async HTTP connections."""
+        if self._async_client is None:
+            return
+        if self._async_client_loop is not asyncio.get_running_loop():
+            self._drop_async_client()
+            return
+        await self._async_client.aclose()
+        self._async_client = None
+        self._async_client_loop = None
+
+    def _drop_async_client(self):
+        """Release the async client of an event loop other than the running one."""
+        client, loop = self._async_client, self._async_client_loop
+        self._async_client = None
+        self._async_client_loop = None
+        if client is None:
+            return
+        if not loop.is_closed():
+            # Close it on its own loop, whenever that loop next runs
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            warnings.warn(
+                f"{self.provider_name} async client was left open when its event loop "
+                "closed; await aclose() before the loop ends",
+                ResourceWarning,
+                stacklevel=3
+            )
+
+    @staticmethod
+    def fingerprint(prompt: str) -> int:
+        """Return a fast 64-bit (xxh3) hash of a prompt."""
+        return xxhash.xxh3_64_intdigest(prompt.encode())
+
+    def _cache_key(self, input_text: str, cacheable: bool) -> Optional[int]:
+        """Return the response cache key, or None if the call must not be cached."""
+        if not self.cache_size or not (cacheable or self.temperature == 0):
+            return None
+        # The model and sampling settings are fixed for this instance, so the
+        # prompt alone identifies a response
+        return self.fingerprint(input_text)
+
+    def _cache_get(self, key: Optional[int]) -> Optional[str]:
+        if key is None:
+            return None
+        response = self._cache.get(key)
+        if response is not None:
+            self._cache.move_to_end(key)
+        return response
+
+    def _cache_put(self, key: Optional[int], response: str):
+        if key is None:
+            return
+        self._cache[key] = response
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def generate(self, input_text: str, cacheable: bool = False) -> str:
+        """
+        Generate a complete response.
+
+        Responses are cached when temperature is 0 or cacheable is True.
+        """
+        key = self._cache_key(input_text, cacheable)
+        if (response := self._cache_get(key)) is not None:
+            return response
+        try:
+            response = self._generate(input_text)
+        except httpx.HTTPError as e:
+            return f"Error during {self.provider_name} request: {e}"
+        except (KeyError, IndexError, ValueError):
+            return f"Error parsing {self.provider_name} API response."
+        self._cache_put(key, response)
+        return response
+
+    async def agenerate(self, input_text: str, cacheable: bool = False) -> str:
+        """Async version of generate()."""
+        key = self._cache_key(input_text, cacheable)
+        if (response := self._cache_get(key)) is not None:
+            return response
+        try:
+            response = await self._agenerate(input_text)
+        except httpx.HTTPError as e:
+            return f"Error during {self.provider_name} request: {e}"
+        except (KeyError, IndexError, ValueError):
+            return f"Error parsing {self.provider_name} API response."
+        self._cache_put(key, response)
+        return response
+
+    def generate_stream(self, input_text: str, cacheable: bool = False) -> Generator[str, None, None]:
+        """
+        Stream the response token by token.
+
+        A response already in the cache is yielded as a single chunk.
+        """
+        if (response := self._cache_get(self._cache_key(input_text, cacheable))) is not None:
+            yield response
+            return
+        yield from self._generate_stream(input_text)
+
+    async def agenerate_stream(self, input_text: str, cacheable: bool = False) -> AsyncGenerator[str, None]:
+        """Async version of generate_stream()."""
+        if (response := self._cache_get(self._cache_key(input_text, cacheable))) is not None:
+            yield response
+            return
+        async for token in self._agenerate_stream(input_text):
+            yield token
+
+    @property
+    def supports_batch_api(self) -> bool:
+        """Whether the provider has a batch endpoint, i.e. defines _agenerate_batch_api()."""
+        return hasattr(self, "_agenerate_batch_api")
+
+    def generate_batch(self, inputs: List[str], use_batch_api: bool = False) -> List[str]:
+        """
+        Generate responses for several inputs.
+
+        Must not be called from a running event loop; use agenerate_batch() there.
+        """
+        async def run_batch() -> List[str]:
+            # The async client is bound to this throwaway loop; close it with the loop
+            try:
+                return await self.agenerate_batch(inputs, use_batch_api)
+            finally:
+                await self.aclose()
+
+        return _run(run_batch())
+
+    async def agenerate_batch(self, inputs: List[str], use_batch_api: bool = False) -> List[str]:
+        """
+        Async version of generate_batch().
+
+        By default the inputs are sent as concurrent requests over the pooled
+        client. With use_batch_api, providers that offer a batch endpoint submit
+        them as one batch job instead, which is cheaper but can take much longer.
+        """
+        if use_batch_api and self.supports_batch_api:
+            try:
+                return await self._agenerate_batch_api(inputs)
+            except httpx.HTTPError as e:
+                return [f"Error during {self.provider_name} batch request: {e}"] * len(inputs)
+            except (KeyError, IndexError, ValueError):
+                return [f"Error parsing {self.provider_name} API response."] * len(inputs)
+        return list(await asyncio.gather(*(self.agenerate(text) for text in inputs)))
+
+    @abstractmethod
+    def _generate(self, input_text: str) -> str:
+        pass
+
+    @abstractmethod
+    def _generate_stream(self, input_text: str) -> Generator[str, None, None]:
+        pass
 
     @abstractmethod
-    def generate(self, input_text: str) -> str:
+    async def _agenerate(self, input_text: str) -> str:
         pass
 
     @abstractmethod
-    def generate_stream(self, input_text: str) -> Generator[str, None, None]:
+    def _agenerate_stream(self, input_text: str) -> AsyncGenerator[str, None]:
         pass
+
+
+def _dig(data: Any, path: Tuple) -> Any:
+    """Follow a path of keys and indices into decoded JSON."""
+    for key in path:
+        data = data[key]
+    return data
+
+class _HTTPChatLLM(BaseLLM):
+    """
+    Provider reached through a JSON chat endpoint that streams with SSE.
+
+    Subclasses describe their API with the class constants below and only
+    override the hooks where their wire format differs.
+    """
+    URL: ClassVar[str]
+    ENV_VAR: ClassVar[str]
+    AUTH_HEADER: ClassVar[str] = "Authorization"
+    AUTH_PREFIX: ClassVar[str] = "Bearer "
+    EXTRA_HEADERS: ClassVar[Dict[str, str]] = {}
+    # Location of the text in a complete response and in a stream event
+    CONTENT_PATH: ClassVar[Tuple]
+    STREAM_DELTA_PATH: ClassVar[Tuple]
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = os.getenv(self.ENV_VAR)
+        self.url = self.URL
+        if not self.api_key:
+            raise ValueError(f"{self.provider_name} API key missing in environment variables.")
+
+        self._headers = {
+            "Content-Type": "application/json",
+            self.AUTH_HEADER: f"{self.AUTH_PREFIX}{self.api_key}",
+            **self.EXTRA_HEADERS
+        }
+        self._base_payload = {**self._build_base_payload(), **self.options}
+
+    def _build_base_payload(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "top_p": self.top_p
+        }
+
+    def _build_messages(self, input_text: str) -> List[Dict[str, Any]]:
+        return [{"role": "user", "content": input_text}]
+
+    def _get_headers(self):
+        return self._headers
+
+    def _get_payload(self, input_text: str, stream: bool = False):
+        return {
+            **self._base_payload,
+            "messages": self._build_messages(input_text),
+            "stream": stream
+        }
+
+    def _extract_text(self, data) -> str:
+        return _dig(data, self.CONTENT_PATH).strip()
+
+    def _extract_delta(self, event: bytes) -> Optional[str]:
+        """Return the text carried by a stream event, if any."""
+        try:
+            return _dig(orjson.loads(event), self.STREAM_DELTA_PATH)
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    def _generate(self, input_text: str) -> str:
+        response = self.client.post(
+            self.url,
+            headers=self._get_headers(),
+            content=orjson.dumps(self._get_payload(input_text))
+        )
+        response.raise_for_status()
+        return self._extract_text(orjson.loads(response.content))
+
+    async def _agenerate(self, input_text: str) -> str:
+        response = await self.async_client.post(
+            self.url,
+            headers=self._get_headers(),
+            content=orjson.dumps(self._get_payload(input_text))
+        )
+        response.raise_for_status()
+        return self._extract_text(orjson.loads(response.content))
+
+    def _generate_stream(self, input_text: str) -> Generator[str, None, None]:
+        try:
+            with self.client.stream(
+                "POST",
+                self.url,
+                headers=self._get_headers(),
+                content=orjson.dumps(self._get_payload(input_text, stream=True))
+            ) as response:
+                response.raise_for_status()
+                for event in iter_sse_data(response.iter_bytes()):
+                    if event == b'[DONE]':
+                        break
+                    if text := self._extract_delta(event):
+                        yield text
+        except Exception as e:
+            yield f"Error during streaming: {e}"
+
+    async def _agenerate_stream(self, input_text: str) -> AsyncGenerator[str, None]:
+        try:
+            async with self.async_client.stream(
+                "POST",
+                self.url,
+                headers=self._get_headers(),
+                content=orjson.dumps(self._get_payload(input_text, stream=True))
+            ) as response:
+                response.raise_for_status()
+                async for event in aiter_sse_data(response.aiter_bytes()):
+                    if event == b'[DONE]':
+                        break
+                    if text := self._extract_delta(event):
+                        yield text
+        except Exception as e:
+            yield f"Error during streaming: {e}"
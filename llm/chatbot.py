@@ -1,64 +1,86 @@
-from typing import List, Dict, Optional, Generator
+from typing import List, Dict, Optional, Generator, AsyncGenerator, AsyncIterable
+import asyncio
+from collections import deque
 from dataclasses import dataclass
 from datetime import datetime
-import json
+import atexit
+import os
+import queue
+import threading
+import time
+import weakref
+import msgspec
 from .base_llm import LLM  # Import from base_llm instead
+from .entities import Entity, EntityStore
 
+# Minimum number of seconds between fsyncs of the history file
+_FSYNC_INTERVAL = 5.0
+
+# Queued to the history writer thread to make it exit
+_STOP = object()
 
-@dataclass
-class Entity:
-    """Represents an entity in the chatbot's knowledge base."""
-    name: str
-    attributes: Dict
-    created_at: datetime = datetime.now()
-    
-    def to_dict(self) -> Dict:
-        return {
-            "name": self.name,
-            "attributes": self.attributes,
-            "created_at": self.created_at.isoformat()
-        }
-    
-    @classmethod
-    def from_dict(cls, data: Dict) -> 'Entity':
-        entity = cls(
-            name=data["name"],
-            attributes=data["attributes"]
-        )
-        if "created_at" in data:
-            entity.created_at = datetime.fromisoformat(data["created_at"])
-        return entity
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Message:
     """Represents a message in the conversation."""
     role: str  # 'user' or 'assistant'
     content: str
 
-@dataclass
-class HistoryEntry:
+class HistoryEntry(msgspec.Struct, frozen=True):
     """Represents a single conversation entry in the history."""
     timestamp: datetime
     query: str
     response: str
     metadata: Optional[Dict] = None
-    
-    def to_dict(self) -> Dict:
-        return {
-            "timestamp": self.timestamp.isoformat(),
-            "query": self.query,
-            "response": self.response,
-            "metadata": self.metadata or {}
-        }
-    
-    @classmethod
-    def from_dict(cls, data: Dict) -> 'HistoryEntry':
-        return cls(
-            timestamp=datetime.fromisoformat(data["timestamp"]),
-            query=data["query"],
-            response=data["response"],
-            metadata=data.get("metadata", {})
-        )
+    # xxh3 fingerprint of the full prompt sent for this query
+    prompt_hash: Optional[int] = None
+
+_encoder = msgspec.json.Encoder()
+_history_decoder = msgspec.json.Decoder(List[HistoryEntry])
+_history_entry_decoder = msgspec.json.Decoder(HistoryEntry)
+
+def _format_turn(entry: HistoryEntry) -> str:
+    """Format a history entry the way it appears in the prompt."""
+    return f"User: {entry.query}\nAssistant: {entry.response}"
+
+def _write_history(entries_queue: queue.SimpleQueue, path: str, errors: List[OSError]):
+    """Append queued entries to the history file until told to stop.
+
+    Runs on the writer thread and holds no reference to the Chatbot, so the
+    Chatbot can still be garbage-collected. Write errors are collected in
+    errors for the Chatbot to re-raise instead of killing the thread.
+    """
+    last_fsync = 0.0
+    stop = False
+    while not stop:
+        # Coalesce everything already queued into a single write
+        entries = []
+        item = entries_queue.get()
+        while True:
+            if item is _STOP:
+                stop = True
+                break
+            entries.extend(item)
+            try:
+                item = entries_queue.get_nowait()
+            except queue.Empty:
+                break
+        if not entries:
+            continue
+        try:
+            with open(path, 'ab') as f:
+                f.write(_encoder.encode_lines(entries))
+                now = time.monotonic()
+                if now - last_fsync >= _FSYNC_INTERVAL:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    last_fsync = now
+        except OSError as e:
+            errors.append(e)
+
+def _flush_at_exit(chatbot_ref: weakref.ref):
+    if (chatbot := chatbot_ref()) is not None:
+        chatbot._flush_history()
 
 class Chatbot:
     def __init__(
@@ -68,8 +90,8 @@ class Chatbot:
         system_prompt: Optional[str] = None,
         context: Optional[str] = None,
         max_history: int = 10,
-        entities_file: str = "chatbot_entities.json",
-        history_file: str = "chatbot_history.json",
+        entities_file: str = "chatbot_entities.db",
+        history_file: str = "chatbot_history.jsonl",
         verbose: bool = False,
         **llm_kwargs
     ):
@@ -82,8 +104,11 @@ class Chatbot:
         - system_prompt: System prompt to guide bot behavior
         - context: Additional context for conversations
         - max_history: Maximum number of messages to keep in history
-        - entities_file: File to store entities
-        - history_file: File to store chat history
+        - entities_file: SQLite database to store entities (a '.json' path is
+          migrated to a '.db' file next to it)
+        - history_file: File to store chat history (JSONL, one entry per line,
+          written by a background thread; see close()). A legacy '.json'
+          history next to a missing '.jsonl' file is imported once
         - verbose: Whether to print detailed information
         - **llm_kwargs: Additional arguments for the LLM provider
         """
@@ -98,66 +123,187 @@ class Chatbot:
         self.entities_file = entities_file
         self.history_file = history_file
         self.verbose = verbose
+        self._writer: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer_thread: Optional[threading.Thread] = None
+        self._writer_errors: List[OSError] = []
+        self._prompt_prefix_cache: Optional[str] = None
+        self._prompt_prefix_key: Optional[tuple] = None
         
         # Load existing data
         self.entities = self._load_entities()
         self.history = self._load_history()
+        self._reset_history_turns()
+        atexit.register(_flush_at_exit, weakref.ref(self))
+        # Let the writer thread exit once this Chatbot is collected
+        weakref.finalize(self, self._writer.put, _STOP)
         
-    def _load_entities(self) -> Dict[str, Entity]:
-        """Load entities from file."""
+    def close(self):
+        """Write out pending history and release files and connections."""
         try:
-            with open(self.entities_file, 'r') as f:
-                data = json.load(f)
-                return {
-                    name: Entity.from_dict(entity_data)
-                    for name, entity_data in data.items()
-                }
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-            
-    def _save_entities(self):
-        """Save entities to file."""
-        with open(self.entities_file, 'w') as f:
-            json.dump(
-                {
-                    name: entity.to_dict()
-                    for name, entity in self.entities.items()
-                },
-                f,
-                indent=2
-            )
+            self._flush_history()
+        finally:
+            self.entities.close()
+            self.llm.close()
+
+    async def aclose(self):
+        """Async version of close(); also closes the LLM's async HTTP client."""
+        try:
+            self.close()
+        finally:
+            await self.llm.aclose()
+
+    def _load_entities(self) -> EntityStore:
+        """Open the entity store, importing a legacy JSON entities file once."""
+        base, ext = os.path.splitext(self.entities_file)
+        if ext == '.json':
+            self.entities_file = f"{base}.db"
+        store = EntityStore(self.entities_file)
+        legacy_file = f"{base}.json"
+        if not len(store) and os.path.exists(legacy_file):
+            try:
+                store.import_json(legacy_file)
+            except msgspec.DecodeError:
+                pass
+        return store
             
     def _load_history(self) -> List[HistoryEntry]:
         """Load chat history from file."""
         try:
-            with open(self.history_file, 'r') as f:
-                data = json.load(f)
-                return [HistoryEntry.from_dict(entry) for entry in data]
-        except (FileNotFoundError, json.JSONDecodeError):
+            with open(self.history_file, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return self._import_legacy_history()
+        
+        # Legacy format: the whole history as a single JSON array
+        if raw.lstrip().startswith(b'['):
+            try:
+                history = _history_decoder.decode(raw)
+            except msgspec.DecodeError:
+                # Unreadable: move it aside rather than overwrite it, and start afresh
+                os.replace(self.history_file, f"{self.history_file}.bak")
+                return []
+            self._compact_history(history)
+            return history
+        
+        try:
+            return _history_entry_decoder.decode_lines(raw)
+        except msgspec.DecodeError:
+            pass
+        
+        # Some line is damaged. Only the last one can have been torn by an
+        # interrupted append, and that one is dropped; any other line that
+        # does not decode is moved to a quarantine file instead of discarded
+        lines = [line for line in raw.splitlines() if line.strip()]
+        history = []
+        bad_lines = []
+        for i, line in enumerate(lines):
+            try:
+                history.append(_history_entry_decoder.decode(line))
+            except msgspec.ValidationError:
+                bad_lines.append(line)
+            except msgspec.DecodeError:
+                if i < len(lines) - 1:
+                    bad_lines.append(line)
+        if bad_lines:
+            with open(f"{self.history_file}.bad", 'ab') as f:
+                f.write(b"\n".join(bad_lines) + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self._compact_history(history)
+        return history
+            
+    def _import_legacy_history(self) -> List[HistoryEntry]:
+        """Import the JSON history file used before the JSONL format, if there is one."""
+        base, ext = os.path.splitext(self.history_file)
+        legacy_file = f"{base}.json"
+        if ext != '.jsonl' or not os.path.exists(legacy_file):
+            return []
+        with open(legacy_file, 'rb') as f:
+            raw = f.read()
+        try:
+            history = _history_decoder.decode(raw)
+        except msgspec.DecodeError:
+            # Left untouched; it is not the file this Chatbot writes to
             return []
+        self._compact_history(history)
+        return history
             
-    def _save_history(self):
-        """Save chat history to file."""
-        with open(self.history_file, 'w') as f:
-            json.dump(
-                [entry.to_dict() for entry in self.history],
-                f,
-                indent=2
+    def _append_history(self, entries: List[HistoryEntry]):
+        """
+        Queue entries for the background history writer.
+        
+        Write errors are not raised here, where they would replace the response
+        being recorded; the next chat or _flush_history() reports them.
+        """
+        if self._writer_thread is None or not self._writer_thread.is_alive():
+            self._writer_thread = threading.Thread(
+                target=_write_history,
+                args=(self._writer, self.history_file, self._writer_errors),
+                name="chatbot-history-writer",
+                daemon=True
             )
+            self._writer_thread.start()
+        self._writer.put(entries)
+            
+    def _flush_history(self):
+        """Wait until every queued entry is written and stop the writer thread."""
+        if self._writer_thread is not None:
+            self._writer.put(_STOP)
+            self._writer_thread.join()
+            self._writer_thread = None
+        self._raise_writer_error()
+
+    def _raise_writer_error(self):
+        """Re-raise the oldest write error the writer thread has not reported yet."""
+        if self._writer_errors:
+            raise self._writer_errors.pop(0)
+            
+    def _compact_history(self, history: Optional[List[HistoryEntry]] = None):
+        """Rewrite the history file so it holds exactly one line per entry."""
+        if history is None:
+            history = self.history
+        # Queued appends must land before the rewrite, not after it
+        self._flush_history()
+        tmp_file = f"{self.history_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(_encoder.encode_lines(history))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.history_file)
             
     def add_entity(self, name: str, attributes: Dict) -> Entity:
         """Add a new entity."""
         entity = Entity(name=name, attributes=attributes)
-        self.entities[name] = entity
-        self._save_entities()
+        self.entities.add(entity)
         return entity
         
+    def add_entities(self, entities: Dict[str, Dict]) -> List[Entity]:
+        """Add several entities, given as name -> attributes, in one transaction."""
+        created_at = datetime.now()
+        added = [
+            Entity(name=name, attributes=attributes, created_at=created_at)
+            for name, attributes in entities.items()
+        ]
+        self.entities.add_many(added)
+        return added
+        
     def get_entity(self, name: str) -> Optional[Entity]:
         """Get entity by name."""
         return self.entities.get(name)
         
     def _create_prompt(self, query: str) -> str:
         """Create complete prompt with context and history."""
+        # The prefix only changes when history or prompt settings change
+        key = (self._history_state(), self.max_history, self.system_prompt, self.context)
+        if self._prompt_prefix_cache is None or key != self._prompt_prefix_key:
+            self._prompt_prefix_cache = self._create_prompt_prefix()
+            self._prompt_prefix_key = key
+        
+        # Add current query
+        return f"{self._prompt_prefix_cache}User: {query}"
+        
+    def _create_prompt_prefix(self) -> str:
+        """Create the part of the prompt that precedes the current query."""
         prompt_parts = []
         
         # Add system prompt
@@ -168,28 +314,44 @@ class Chatbot:
         if self.context:
             prompt_parts.append(f"Context: {self.context}\n")
         
-        # Add relevant history
-        if self.history:
+        # Add relevant history; the turns are rebuilt if history was changed
+        # other than through _add_history_entries()
+        if (self._history_turns.maxlen != self.max_history
+                or self._history_turns_state != self._history_state()):
+            self._reset_history_turns()
+        if self._history_turns:
             prompt_parts.append("Previous conversation:")
-            for entry in self.history[-self.max_history:]:
-                prompt_parts.extend([
-                    f"User: {entry.query}",
-                    f"Assistant: {entry.response}"
-                ])
+            prompt_parts.append("\n".join(self._history_turns))
             prompt_parts.append("")
         
-        # Add current query
-        prompt_parts.append(f"User: {query}")
+        return "".join(f"{part}\n" for part in prompt_parts)
         
-        return "\n".join(prompt_parts)
+    def _reset_history_turns(self):
+        """Rebuild the formatted turns of the last max_history entries."""
+        self._history_turns = deque(
+            (_format_turn(entry) for entry in self.history[-self.max_history:]),
+            maxlen=self.max_history
+        )
+        self._history_turns_state = self._history_state()
+        
+    def _history_state(self) -> tuple:
+        """
+        Cheaply identify the current history, to tell when cached turns are stale.
         
-    def chat(self, query: str, stream: bool = False) -> str | Generator[str, None, None]:
+        Catches replacing the list and adding or removing entries at its end;
+        editing an entry in the middle of the list in place is not detected.
+        """
+        return (self.history, len(self.history), self.history[-1] if self.history else None)
+        
+    def chat(self, query: str, stream: bool = False, cacheable: bool = False) -> str | Generator[str, None, None]:
         """
         Process user input and generate response.
         
         Parameters:
         - query: User's message
         - stream: Whether to stream the response
+        - cacheable: Whether an identical earlier prompt's response may be reused
+          (always the case when temperature is 0)
         
         Returns:
         - str or Generator: Assistant's response
@@ -197,48 +359,161 @@ class Chatbot:
         if self.verbose:
             print(f"\nProcessing query: {query}")
         
+        # Report a failed history write before paying for another response
+        self._raise_writer_error()
+        
+        # Create complete prompt
+        prompt = self._create_prompt(query)
+        
+        if stream:
+            return self._stream_response(query, prompt, cacheable)
+        else:
+            return self._generate_response(query, prompt, cacheable)
+
+    async def achat(self, query: str, stream: bool = False, cacheable: bool = False) -> str | AsyncGenerator[str, None]:
+        """
+        Async version of chat(); several chats can be awaited concurrently.
+        
+        Parameters:
+        - query: User's message
+        - stream: Whether to stream the response
+        - cacheable: Whether an identical earlier prompt's response may be reused
+          (always the case when temperature is 0)
+        
+        Returns:
+        - str or AsyncGenerator: Assistant's response
+        """
+        if self.verbose:
+            print(f"\nProcessing query: {query}")
+        
+        # Report a failed history write before paying for another response
+        self._raise_writer_error()
+        
         # Create complete prompt
         prompt = self._create_prompt(query)
         
         if stream:
-            return self._stream_response(query, prompt)
+            return self._astream_response(query, prompt, cacheable)
         else:
-            return self._generate_response(query, prompt)
+            return await self._agenerate_response(query, prompt, cacheable)
+
+    def chat_many(self, queries: List[str], use_batch_api: bool = False) -> List[str]:
+        """
+        Answer several independent queries against the current history.
+        
+        Parameters:
+        - queries: User messages; none of them sees the others' responses
+        - use_batch_api: Submit through the provider's batch endpoint when it
+          has one (cheaper, but may take up to a day to complete)
+        
+        Returns:
+        - list of str: Assistant's responses, in query order
+        """
+        self._raise_writer_error()
+        prompts = [self._create_prompt(query) for query in queries]
+        responses = self.llm.generate_batch(prompts, use_batch_api=use_batch_api)
+        self._add_history_entries(queries, prompts, responses)
+        return responses
+
+    async def achat_many(self, queries: List[str], use_batch_api: bool = False) -> List[str]:
+        """Async version of chat_many()."""
+        self._raise_writer_error()
+        prompts = [self._create_prompt(query) for query in queries]
+        responses = await self.llm.agenerate_batch(prompts, use_batch_api=use_batch_api)
+        self._add_history_entries(queries, prompts, responses)
+        return responses
 
-    def _generate_response(self, query: str, prompt: str) -> str:
+    async def serve(self, queries: AsyncIterable[str], concurrency: int = 32) -> List[str]:
+        """
+        Answer queries from an async source concurrently.
+        
+        Parameters:
+        - queries: Async iterable of user messages; each is sent as it arrives
+        - concurrency: Maximum number of requests in flight at once
+        
+        Returns:
+        - list of str: Assistant's responses, in query order
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def answer(query: str) -> str:
+            async with semaphore:
+                return await self.achat(query)
+        
+        tasks = [asyncio.ensure_future(answer(query)) async for query in queries]
+        return list(await asyncio.gather(*tasks))
+
+    def _add_history_entries(
+        self,
+        queries: List[str],
+        prompts: List[str],
+        responses: List[str]
+    ) -> List[HistoryEntry]:
+        """Record completed exchanges in memory and on disk."""
+        timestamp = datetime.now()
+        entries = [
+            HistoryEntry(
+                timestamp=timestamp,
+                query=query,
+                response=response,
+                prompt_hash=self.llm.fingerprint(prompt)
+            )
+            for query, prompt, response in zip(queries, prompts, responses)
+        ]
+        in_sync = self._history_turns_state == self._history_state()
+        self.history.extend(entries)
+        if in_sync:
+            self._history_turns.extend(_format_turn(entry) for entry in entries)
+            self._history_turns_state = self._history_state()
+        self._append_history(entries)
+        return entries
+
+    def _generate_response(self, query: str, prompt: str, cacheable: bool = False) -> str:
         """Generate a complete response."""
-        response = self.llm.generate(prompt)
+        response = self.llm.generate(prompt, cacheable=cacheable)
         
         # Save to history
-        entry = HistoryEntry(
-            timestamp=datetime.now(),
-            query=query,
-            response=response
-        )
-        self.history.append(entry)
-        self._save_history()
+        self._add_history_entries([query], [prompt], [response])
         
         if self.verbose:
             print(f"Generated response: {response}")
         
         return response
 
-    def _stream_response(self, query: str, prompt: str) -> Generator[str, None, None]:
+    async def _agenerate_response(self, query: str, prompt: str, cacheable: bool = False) -> str:
+        """Generate a complete response asynchronously."""
+        response = await self.llm.agenerate(prompt, cacheable=cacheable)
+        
+        # Save to history
+        self._add_history_entries([query], [prompt], [response])
+        
+        if self.verbose:
+            print(f"Generated response: {response}")
+        
+        return response
+
+    def _stream_response(self, query: str, prompt: str, cacheable: bool = False) -> Generator[str, None, None]:
         """Stream the response token by token."""
+        # A list joined once at the end is cheaper here than io.StringIO
         full_response = []
         
-        for token in self.llm.generate_stream(prompt):
+        for token in self.llm.generate_stream(prompt, cacheable=cacheable):
             full_response.append(token)
             yield token
         
         # Save complete response to history
-        entry = HistoryEntry(
-            timestamp=datetime.now(),
-            query=query,
-            response=''.join(full_response)
-        )
-        self.history.append(entry)
-        self._save_history()
+        self._add_history_entries([query], [prompt], [''.join(full_response)])
+
+    async def _astream_response(self, query: str, prompt: str, cacheable: bool = False) -> AsyncGenerator[str, None]:
+        """Stream the response token by token asynchronously."""
+        full_response = []
+        
+        async for token in self.llm.agenerate_stream(prompt, cacheable=cacheable):
+            full_response.append(token)
+            yield token
+        
+        # Save complete response to history
+        self._add_history_entries([query], [prompt], [''.join(full_response)])
         
     def get_history(self) -> List[HistoryEntry]:
         """Get chat history."""
@@ -247,4 +522,6 @@ class Chatbot:
     def clear_history(self):
         """Clear chat history."""
         self.history = []
-        self._save_history()
+        self._reset_history_turns()
+        self._prompt_prefix_cache = None
+        self._compact_history()
@@ -0,0 +1,109 @@
+# llm/entities.py
+
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional
+import sqlite3
+import threading
+import msgspec
+
+
+class Entity(msgspec.Struct, frozen=True):
+    """Represents an entity in the chatbot's knowledge base."""
+    name: str
+    attributes: Dict
+    created_at: datetime = msgspec.field(default_factory=datetime.now)
+
+_legacy_decoder = msgspec.json.Decoder(Dict[str, Entity])
+
+def _row(entity: Entity) -> tuple:
+    return (
+        entity.name,
+        msgspec.json.encode(entity.attributes),
+        entity.created_at.timestamp()
+    )
+
+def _entity(row: tuple) -> Entity:
+    name, attributes, created_at = row
+    return Entity(
+        name=name,
+        attributes=msgspec.json.decode(attributes),
+        created_at=datetime.fromtimestamp(created_at)
+    )
+
+
+class EntityStore(Mapping):
+    """Entities kept in a SQLite database and looked up by name."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # Autocommit: each add is its own transaction, batches open one explicitly.
+        # One connection shared across threads, serialized by _lock
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA mmap_size=268435456;
+            CREATE TABLE IF NOT EXISTS entities (
+                name TEXT PRIMARY KEY,
+                attributes BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+        """)
+
+    def add(self, entity: Entity):
+        """Insert or replace a single entity."""
+        row = _row(entity)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entities VALUES (?, ?, ?)", row)
+
+    def add_many(self, entities: Iterable[Entity]):
+        """Insert or replace several entities in one transaction."""
+        rows = [_row(entity) for entity in entities]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO entities VALUES (?, ?, ?)", rows)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def import_json(self, path: str):
+        """Import entities from the JSON file format used before the SQLite store."""
+        with open(path, 'rb') as f:
+            self.add_many(_legacy_decoder.decode(f.read()).values())
+
+    def get(self, name: str, default: Optional[Entity] = None) -> Optional[Entity]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT name, attributes, created_at FROM entities WHERE name = ?", (name,)
+            ).fetchone()
+        return _entity(row) if row else default
+
+    def __getitem__(self, name: str) -> Entity:
+        entity = self.get(name)
+        if entity is None:
+            raise KeyError(name)
+        return entity
+
+    def __contains__(self, name) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM entities WHERE name = ?", (name,)
+            ).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        # Fetched up front so the lock is not held while the caller iterates
+        with self._lock:
+            names = [name for (name,) in self._db.execute("SELECT name FROM entities")]
+        return iter(names)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
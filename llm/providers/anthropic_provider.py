@@ -1,67 +1,52 @@
-import os
-import requests
-from typing import Generator
-import json
-from ..base import BaseLLM
+import asyncio
+from typing import List
+import orjson
+from ..base import BATCH_POLL_INTERVAL, _HTTPChatLLM
 
-class AnthropicLLM(BaseLLM):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.api_key = os.getenv("ANTHROPIC_API_KEY")
-        self.url = "https://api.anthropic.com/v1/messages"
-        if not self.api_key:
-            raise ValueError("Anthropic API key missing in environment variables.")
+class AnthropicLLM(_HTTPChatLLM):
+    provider_name = "Anthropic"
+    URL = "https://api.anthropic.com/v1/messages"
+    BATCH_URL = "https://api.anthropic.com/v1/messages/batches"
+    ENV_VAR = "ANTHROPIC_API_KEY"
+    AUTH_HEADER = "x-api-key"
+    AUTH_PREFIX = ""
+    EXTRA_HEADERS = {"anthropic-version": "2023-06-01"}
+    CONTENT_PATH = ("content", 0, "text")
+    STREAM_DELTA_PATH = ("delta", "text")
 
-    def _get_headers(self):
-        return {
-            "Content-Type": "application/json",
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01"
-        }
+    async def _agenerate_batch_api(self, inputs: List[str]) -> List[str]:
+        requests = []
+        for i, input_text in enumerate(inputs):
+            params = self._get_payload(input_text)
+            del params["stream"]
+            requests.append({"custom_id": str(i), "params": params})
 
-    def _get_payload(self, input_text: str, stream: bool = False):
-        return {
-            "model": self.model,
-            "messages": [{"role": "user", "content": input_text}],
-            "max_tokens": self.max_tokens,
-            "temperature": self.temperature,
-            "top_p": self.top_p,
-            "stream": stream,
-            **self.options
-        }
-
-    def generate(self, input_text: str) -> str:
-        try:
-            response = requests.post(
-                self.url,
-                headers=self._get_headers(),
-                json=self._get_payload(input_text)
+        response = await self.async_client.post(
+            self.BATCH_URL,
+            headers=self._get_headers(),
+            content=orjson.dumps({"requests": requests})
+        )
+        response.raise_for_status()
+        batch = orjson.loads(response.content)
+        while batch["processing_status"] != "ended":
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            response = await self.async_client.get(
+                f"{self.BATCH_URL}/{batch['id']}",
+                headers=self._get_headers()
             )
             response.raise_for_status()
-            return response.json()["content"][0]["text"].strip()
-        except requests.exceptions.RequestException as e:
-            return f"Error during Anthropic request: {e}"
-        except KeyError:
-            return "Error parsing Anthropic API response."
+            batch = orjson.loads(response.content)
 
-    def generate_stream(self, input_text: str) -> Generator[str, None, None]:
-        try:
-            response = requests.post(
-                self.url,
-                headers=self._get_headers(),
-                json=self._get_payload(input_text, stream=True),
-                stream=True
-            )
-            response.raise_for_status()
-            
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        if line == 'data: [DONE]':
-                            break
-                        data = json.loads(line[6:])
-                        if 'delta' in data and 'text' in data['delta']:
-                            yield data['delta']['text']
-        except Exception as e:
-            yield f"Error during streaming: {e}"
+        response = await self.async_client.get(batch["results_url"], headers=self._get_headers())
+        response.raise_for_status()
+        results = ["Error parsing Anthropic API response."] * len(inputs)
+        for line in response.content.splitlines():
+            if not line:
+                continue
+            item = orjson.loads(line)
+            result = item["result"]
+            if result["type"] == "succeeded":
+                results[int(item["custom_id"])] = self._extract_text(result["message"])
+            else:
+                results[int(item["custom_id"])] = f"Error during Anthropic batch request: {result['type']}"
+        return results
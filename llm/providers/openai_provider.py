@@ -1,68 +1,93 @@
-import os
-import requests
-import json
-from typing import Generator
-from ..base import BaseLLM
+import asyncio
+import orjson
+from typing import Any, Dict, List
+from ..base import BATCH_POLL_INTERVAL, _HTTPChatLLM
 
-class OpenAILLM(BaseLLM):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        self.url = "https://api.openai.com/v1/chat/completions"
-        if not self.api_key:
-            raise ValueError("OpenAI API key missing in environment variables.")
+class OpenAILLM(_HTTPChatLLM):
+    provider_name = "OpenAI"
+    URL = "https://api.openai.com/v1/chat/completions"
+    BATCH_URL = "https://api.openai.com/v1/batches"
+    FILES_URL = "https://api.openai.com/v1/files"
+    ENV_VAR = "OPENAI_API_KEY"
+    CONTENT_PATH = ("choices", 0, "message", "content")
+    STREAM_DELTA_PATH = ("choices", 0, "delta", "content")
 
-    def _get_headers(self):
+    def _build_base_payload(self) -> Dict[str, Any]:
         return {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
-    def _get_payload(self, input_text: str, stream: bool = False):
-        return {
-            "model": self.model,
-            "messages": [{"role": "user", "content": input_text}],
-            "temperature": self.temperature,
-            "max_tokens": self.max_tokens,
-            "top_p": self.top_p,
+            **super()._build_base_payload(),
             "frequency_penalty": self.frequency_penalty,
-            "presence_penalty": self.presence_penalty,
-            "stream": stream,
-            **self.options
+            "presence_penalty": self.presence_penalty
         }
 
-    def generate(self, input_text: str) -> str:
-        try:
-            response = requests.post(
-                self.url,
-                headers=self._get_headers(),
-                json=self._get_payload(input_text)
+    async def _agenerate_batch_api(self, inputs: List[str]) -> List[str]:
+        lines = []
+        for i, input_text in enumerate(inputs):
+            body = self._get_payload(input_text)
+            del body["stream"]
+            lines.append(orjson.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body
+            }))
+
+        # The batch input has to be uploaded as a JSONL file first
+        auth_headers = {"Authorization": f"Bearer {self.api_key}"}
+        response = await self.async_client.post(
+            self.FILES_URL,
+            headers=auth_headers,
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", b"\n".join(lines), "application/jsonl")}
+        )
+        response.raise_for_status()
+        input_file_id = orjson.loads(response.content)["id"]
+
+        response = await self.async_client.post(
+            self.BATCH_URL,
+            headers=self._get_headers(),
+            content=orjson.dumps({
+                "input_file_id": input_file_id,
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h"
+            })
+        )
+        response.raise_for_status()
+        batch = orjson.loads(response.content)
+        while batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            response = await self.async_client.get(
+                f"{self.BATCH_URL}/{batch['id']}",
+                headers=self._get_headers()
             )
             response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"].strip()
-        except requests.exceptions.RequestException as e:
-            return f"Error during OpenAI request: {e}"
-        except KeyError:
-            return "Error parsing OpenAI API response."
+            batch = orjson.loads(response.content)
 
-    def generate_stream(self, input_text: str) -> Generator[str, None, None]:
-        try:
-            response = requests.post(
-                self.url,
-                headers=self._get_headers(),
-                json=self._get_payload(input_text, stream=True),
-                stream=True
+        results = [f"Error during OpenAI batch request: batch {batch['status']}"] * len(inputs)
+        # Successful requests land in the output file, failed ones in the error file
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            response = await self.async_client.get(
+                f"{self.FILES_URL}/{file_id}/content",
+                headers=auth_headers
             )
             response.raise_for_status()
-            
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        if line == 'data: [DONE]':
-                            break
-                        data = json.loads(line[6:])
-                        if content := data['choices'][0].get('delta', {}).get('content'):
-                            yield content
-        except Exception as e:
-            yield f"Error during streaming: {e}"
+            for line in response.content.splitlines():
+                if not line:
+                    continue
+                item = orjson.loads(line)
+                if (result := item.get("response")) and result["status_code"] == 200:
+                    results[int(item["custom_id"])] = self._extract_text(result["body"])
+                else:
+                    results[int(item["custom_id"])] = (
+                        f"Error during OpenAI batch request: {_batch_item_error(item)}"
+                    )
+        return results
+
+
+def _batch_item_error(item: Dict[str, Any]) -> Any:
+    """Return the error message of a failed request in a batch output or error file."""
+    error = item.get("error") or ((item.get("response") or {}).get("body") or {}).get("error")
+    if isinstance(error, dict):
+        return error.get("message") or error.get("code") or error
+    return error
@@ -0,0 +1,59 @@
+# llm/sse.py
+
+from typing import AsyncIterator, Iterator, List, Optional
+
+
+def _event_data(buffer: bytearray, start: int, end: int) -> Optional[bytes]:
+    """Return the data of the event in buffer[start:end], or None if it carries no data."""
+    # Fast path: the usual single 'data: ...' line, copied out of the buffer once
+    if buffer.startswith(b"data: ", start, end) and buffer.find(b"\n", start + 6, end) == -1:
+        with memoryview(buffer) as view:
+            return bytes(view[start + 6:end])
+
+    data = []
+    for line in buffer[start:end].split(b"\n"):
+        field, _, value = line.partition(b":")
+        if field == b"data":
+            data.append(value[1:] if value.startswith(b" ") else value)
+    return bytes(b"\n".join(data)) if data else None
+
+
+class SSEDataDecoder:
+    """Incrementally split a server-sent event byte stream into event data payloads."""
+
+    def __init__(self):
+        # Unconsumed bytes; grown in place and trimmed once per chunk
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """Consume a chunk and return the data of every event it completes."""
+        buffer = self._buffer
+        buffer += chunk
+        if b"\r" in buffer:
+            # A trailing '\r' may be the first half of a '\r\n' split across chunks
+            end = len(buffer) - 1 if buffer.endswith(b"\r") else len(buffer)
+            buffer[:end] = buffer[:end].replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        events = []
+        start = 0
+        while (end := buffer.find(b"\n\n", start)) != -1:
+            if end > start and (data := _event_data(buffer, start, end)) is not None:
+                events.append(data)
+            start = end + 2
+        del buffer[:start]
+        return events
+
+
+def iter_sse_data(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Yield the data of each event in a stream of byte chunks."""
+    decoder = SSEDataDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+
+
+async def aiter_sse_data(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Async version of iter_sse_data()."""
+    decoder = SSEDataDecoder()
+    async for chunk in chunks:
+        for data in decoder.feed(chunk):
+            yield data